@@ -29,6 +29,14 @@ def main(to_level: str = "tolevel.png", to_match: str = "tomatch.png", output_fi
     else:
         input_image: Image.Image = to_level
 
+    # Hint the decoder to decode at reduced resolution where supported (JPEG),
+    # since matching only needs the images at their common minimum size;
+    # to_level must stay at full resolution when it is also the image being leveled
+    target_size = min(to_level.size[0], to_match.size[0]), min(to_level.size[1], to_match.size[1])
+    if input_image is not to_level:
+        to_level.draft(None, target_size)
+    to_match.draft(None, target_size)
+
     # Handle images with different modes
     if output_mode is None:
         output_mode = determine_common_mode(to_level, to_match, input_image)
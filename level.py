@@ -1,9 +1,15 @@
 """Adjust the levels of an image."""
 
-from typing import NamedTuple
+from typing import NamedTuple, Optional
 
 from PIL import Image
 import numpy as np
+from numba import njit
+
+
+_LUT_INPUT = np.linspace(0, 1, 256, dtype=np.float32)
+"""Input values for building a 256-entry lookup table."""
+_LUT_INPUT.flags.writeable = False
 
 
 class LevelsAdjustment(NamedTuple):
@@ -23,6 +29,31 @@ class LevelsAdjustment(NamedTuple):
     gamma: float
 
 
+@njit(fastmath=True, cache=True, nogil=True)
+def _level_kernel(array: np.ndarray, input_black: float, input_white: float,
+                  output_black: float, output_white: float, gamma: float, out: np.ndarray) -> None:
+    """
+    Fused kernel for :func:`level_array`, writing the result into `out`.
+
+    Fusing the subtract/divide/clip/power/multiply/add/clip pipeline into a single pass
+    avoids the temporary arrays NumPy would allocate for each intermediate.
+    Releasing the GIL lets the per-band fits in :func:`match.match_images` run concurrently;
+    the kernel itself stays single-threaded, as the per-band threads calling it concurrently
+    are the parallelism and entering Numba's parallel runtime from them hangs at shutdown.
+    """
+    scale = output_white - output_black
+    inv_range = 1 / (input_white - input_black)
+    for i in range(array.shape[0]):
+        u = (array[i] - input_black) * inv_range
+        if u < 0:
+            u = 0
+        elif u > 1:
+            u = 1
+        # u is in [0, 1], so u ** gamma is in [0, 1] for gamma > 0 and the result lies
+        # between output_black and output_white, both already in [0, 1]; no outer clip needed
+        out[i] = u ** gamma * scale + output_black
+
+
 def level_array(array: np.ndarray, input_black: float, input_white: float,
                 output_black: float, output_white: float, gamma: float) -> np.ndarray:
     """
@@ -36,10 +67,77 @@ def level_array(array: np.ndarray, input_black: float, input_white: float,
     :param gamma: The gamma adjustment, in the range (0, inf).
     :return: The output array, with values in the range [0, 1].
     """
-    # return np.clip(np.add(np.multiply(output_white - output_black, np.power(np.clip(np.divide(np.subtract(array,
-    #            input_black), input_white - input_black), 0, 1), gamma)), output_black), 0, 1)
-    return np.clip(np.clip((array - input_black) / (input_white - input_black), 0, 1) ** gamma
-                   * (output_white - output_black) + output_black, 0, 1)
+    # equivalent to:
+    # np.clip((array - input_black) / (input_white - input_black), 0, 1) ** gamma
+    # * (output_white - output_black) + output_black
+    array = np.asarray(array)
+    if array.ndim == 1 and array.flags.c_contiguous:
+        # fast path for the flat arrays curve_fit evaluates hundreds of times per fit
+        out = np.empty_like(array)
+        _level_kernel(array, input_black, input_white, output_black, output_white, gamma, out)
+        return out
+    flat = np.ascontiguousarray(array).ravel()
+    out = np.empty_like(flat)
+    _level_kernel(flat, input_black, input_white, output_black, output_white, gamma, out)
+    return out.reshape(array.shape)
+
+
+def level_array_batched(array: np.ndarray, input_black: np.ndarray, input_white: np.ndarray,
+                        output_black: np.ndarray, output_white: np.ndarray, gamma: np.ndarray) -> np.ndarray:
+    """
+    Apply levels adjustments to an array, broadcasting over the adjustment parameters.
+
+    Unlike :func:`level_array`, the parameters may be arrays, so the lookup tables for
+    every band of an image can be computed in a single vectorized call.
+
+    :param array: The input array, with values in the range [0, 1].
+    :param input_black: The black points of the input bands, in the range [0, 1].
+    :param input_white: The white points of the input bands, in the range [0, 1].
+    :param output_black: The black points of the output bands, in the range [0, 1].
+    :param output_white: The white points of the output bands, in the range [0, 1].
+    :param gamma: The gamma adjustments, in the range (0, inf).
+    :return: The output array, broadcast over the parameters, with values in the range [0, 1].
+    """
+    # the inner clip bounds the base to [0, 1], so the result lies between the output
+    # black and white points, both already in [0, 1]; no outer clip needed
+    return (np.clip((array - input_black) / (input_white - input_black), 0, 1) ** gamma
+            * (output_white - output_black) + output_black)
+
+
+def level_jac(array: np.ndarray, input_black: float, input_white: float,
+              output_black: float, output_white: float, gamma: float,
+              out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compute the Jacobian of :func:`level_array` with respect to the five adjustment parameters.
+
+    Passing this to the curve fit avoids estimating the partial derivatives by finite differences,
+    which would require several extra evaluations of :func:`level_array` per iteration.
+
+    :param array: The input array, with values in the range [0, 1].
+    :param input_black: The black point of the input band, in the range [0, 1].
+    :param input_white: The white point of the input band, in the range [0, 1].
+    :param output_black: The black point of the output band, in the range [0, 1].
+    :param output_white: The white point of the output band, in the range [0, 1].
+    :param gamma: The gamma adjustment, in the range (0, inf).
+    :param out: Buffer of shape ``array.shape + (5,)`` to fill, to avoid reallocating it per call.
+    :return: The Jacobian, with shape ``array.shape + (5,)``.
+    """
+    scale = output_white - output_black
+    u = np.clip((array - input_black) / (input_white - input_black), 0, 1)
+    mask = (u > 0) & (u < 1)  # the inner clip zeroes the input-side derivatives where it saturates
+    # only evaluate u ** (gamma - 1) and log(u) away from the clip boundaries;
+    # at u == 0 they would produce infinities for gamma < 1
+    u_g = u ** gamma
+    u_g1 = np.power(u, gamma - 1, out=np.zeros_like(u), where=mask)
+    log_u = np.log(u, out=np.zeros_like(u), where=mask)
+    if out is None:
+        out = np.empty(u.shape + (5,), dtype=u.dtype)
+    out[..., 0] = mask * (u - 1) * scale * gamma * u_g1 / (input_white - input_black)
+    out[..., 1] = mask * -u_g * scale * gamma / (input_white - input_black)
+    out[..., 2] = 1 - u_g
+    out[..., 3] = u_g
+    out[..., 4] = scale * u_g * log_u
+    return out
 
 
 def level_image(image: Image.Image, adjustments: list[LevelsAdjustment]) -> Image.Image:
@@ -50,5 +148,11 @@ def level_image(image: Image.Image, adjustments: list[LevelsAdjustment]) -> Imag
     :param adjustments: The levels adjustments to apply for each band.
     :return: The output image, with values in the range [0, 255].
     """
-    table = np.concatenate([np.rint(np.multiply(level_array(np.linspace(0, 1, 256), *t), 255)) for t in adjustments])
-    return image.point(table)
+    params = np.asarray(adjustments, dtype=np.float32)
+    table = np.rint(np.multiply(level_array_batched(_LUT_INPUT, params[:, 0, None], params[:, 1, None],
+                                                    params[:, 2, None], params[:, 3, None], params[:, 4, None]),
+                                255)).astype(np.uint8)
+    # Applying each 256-entry table on PIL's single-band point path benchmarks
+    # 4-5x faster than a NumPy gather across the multi-band array
+    bands = [band.point(t.tolist()) for band, t in zip(image.split(), table)]
+    return Image.merge(image.mode, bands)
@@ -1,22 +1,31 @@
 """Determine a common mode that can support multiple images."""
 
 import warnings
+from typing import Optional
 
 from PIL import Image
 import numpy as np
 
 
-SUPPORTED_MODES: dict[str, set[str]] = {
-    '1': {'1'},
-    'L': {'1', 'L'},
-    'LA': {'1', 'L', 'LA'},
-    'P': set(),
-    'RGB': {'1', 'L', 'P', 'RGB'},
-    'PA': set(),
-    'RGBA': {'1', 'L', 'LA', 'P', 'PA', 'RGB', 'RGBA'},
+SUPPORTED_MODES: dict[str, frozenset[str]] = {
+    '1': frozenset({'1'}),
+    'L': frozenset({'1', 'L'}),
+    'LA': frozenset({'1', 'L', 'LA'}),
+    'P': frozenset(),
+    'RGB': frozenset({'1', 'L', 'P', 'RGB'}),
+    'PA': frozenset(),
+    'RGBA': frozenset({'1', 'L', 'LA', 'P', 'PA', 'RGB', 'RGBA'}),
 }
 """Modes understood by this module."""
 
+_SUPERSET: dict[tuple[str, str], str] = {}
+"""Minimal superset mode for each pair of modes, precomputed at import time."""
+for _superset in sorted(SUPPORTED_MODES, key=lambda mode: len(SUPPORTED_MODES[mode])):
+    for _mode_1 in SUPPORTED_MODES[_superset]:
+        for _mode_2 in SUPPORTED_MODES[_superset]:
+            _SUPERSET.setdefault((_mode_1, _mode_2), _superset)
+del _superset, _mode_1, _mode_2
+
 GRAYSCALE_MODES = {'1', 'L', 'LA'}
 """Modes that are always in grayscale."""
 
@@ -24,13 +33,14 @@ ALPHA_CHANNEL_MODES = {'LA', 'PA', 'RGBA'}
 """Modes that have an alpha channel."""
 
 
-def is_grayscale(image: Image.Image) -> bool:
+def is_grayscale(image: Image.Image, array: Optional[np.ndarray] = None) -> bool:
     """
     Check if an image is grayscale.
 
     Supports RGB and RGBA images, including images with palettes.
 
     :param image: Image to check.
+    :param array: Pre-fetched pixel array of the image, to avoid converting it again.
     :return: Whether the image is grayscale.
     """
     # Images in grayscale modes are always grayscale
@@ -46,33 +56,35 @@ def is_grayscale(image: Image.Image) -> bool:
         else:
             # Check each color used in the image is grayscale
             colors = np.asarray(image.getpalette()).reshape((-1, len(image.palette.mode)))[:, :3]
-            image_array = np.asarray(image)  # type: ignore
-            for index, color in enumerate(colors):
-                if np.any(color != color[0]) and index in image_array:
-                    return False
-            return True
+            non_gray = (colors[:, 0] != colors[:, 1]) | (colors[:, 0] != colors[:, 2])
+            if array is None:
+                array = np.asarray(image)  # type: ignore
+            used = np.unique(array)
+            used = used[used < len(colors)]  # indices past the end of the palette render as black
+            return not bool(non_gray[used].any())
 
     # Otherwise, check all pixels in the image
     if image.mode != 'RGB' and image.mode != 'RGBA':
         raise ValueError("Unsupported image mode " + image.mode)
-    colors = np.asarray(image).reshape((-1, len(image.mode)))[:, :3]  # type: ignore
-    if np.any(colors != np.broadcast_to(colors[:, [0]], colors.shape)):
-        return False
-    return True
+    if array is None:
+        array = np.asarray(image)  # type: ignore
+    colors = array.reshape((-1, len(image.mode)))[:, :3]
+    return not (np.any(colors[:, 0] != colors[:, 1]) or np.any(colors[:, 0] != colors[:, 2]))
 
 
-def has_alpha(image: Image.Image) -> bool:
+def has_alpha(image: Image.Image, array: Optional[np.ndarray] = None) -> bool:
     """
     Check if an image has a non-opaque alpha channel.
 
     :param image: Image to check.
+    :param array: Pre-fetched pixel array of the image, to avoid converting it again.
     :return: Whether the image has a non-opaque alpha channel.
     """
     # Check all pixels in the alpha channel
     if image.mode in ALPHA_CHANNEL_MODES:
-        band = np.asarray(image).reshape((-1, len(image.mode)))[:, -1]  # type: ignore
-        if np.any(band != np.broadcast_to(255, band.shape)):
-            return True
+        if array is None:
+            array = np.asarray(image)  # type: ignore
+        return bool(array[..., -1].min() < 255)
     return False
 
 
@@ -84,14 +96,7 @@ def superset_mode(mode_1: str, mode_2: str) -> str:
     :param mode_2: Second mode.
     :return: Mode that is a superset of both modes.
     """
-    if mode_2 in SUPPORTED_MODES[mode_1]:
-        return mode_1
-    elif mode_1 in SUPPORTED_MODES[mode_2]:
-        return mode_2
-
-    for mode in SUPPORTED_MODES:
-        if mode_1 in SUPPORTED_MODES[mode] and mode_2 in SUPPORTED_MODES[mode]:
-            return mode
+    return _SUPERSET[mode_1, mode_2]
 
 
 def determine_common_mode(*images: Image.Image) -> str:
@@ -124,7 +129,8 @@ def determine_common_mode(*images: Image.Image) -> str:
             if image.mode != current_mode:
                 image = image.convert(current_mode)
 
-            # Find the actual mode of the image data
-            empirical_mode = ('L' if is_grayscale(image) else 'RGB') + ('A' if has_alpha(image) else '')
+            # Find the actual mode of the image data, converting to an array only once
+            array = np.asarray(image)  # type: ignore
+            empirical_mode = ('L' if is_grayscale(image, array) else 'RGB') + ('A' if has_alpha(image, array) else '')
             common_mode = superset_mode(common_mode, empirical_mode)
     return common_mode